@@ -1,17 +1,35 @@
 import requests
-import json
-from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+import orjson
+from pathlib import Path
+import geopandas as gpd
+import matplotlib
+matplotlib.use("Agg")  # headless raster backend; the figure is only saved to file
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import argparse
-from shapely.geometry import Point, shape
+import shapely
 
 # ---------------------------
 # Fetch Public Fire Incident Data from API
 # ---------------------------
+
+# Shared session with keep-alive, so the TCP+TLS handshake is paid once and
+# reused across result pages (and any repeated calls).
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+# ArcGIS caps how many features a single query returns; page through results.
+_PAGE_SIZE = 2000
+
 def fetch_fire_data(polygon):
     """
-    Fetches public fire incident data from the ArcGIS REST API.
+    Fetches public fire incident data from the ArcGIS REST API, paging through
+    the results on the shared keep-alive session. Requests ArcGIS' native JSON
+    with only the two attributes we actually read, which shrinks both the bytes
+    on the wire and the JSON left to parse.
     Filters include:
       - A polygon bounding box covering the desired area
       - The fire detection timeframe: June 1 2024 to September 30 2024
@@ -20,29 +38,43 @@ def fetch_fire_data(polygon):
     url = "https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/WFIGS_Incident_Locations/FeatureServer/0/query"
 
     # Convert the polygon dictionary to a JSON string
-    polygon_str = json.dumps(polygon)
-    
+    polygon_str = orjson.dumps(polygon).decode()
+
     # Set up parameters for the API call.
     params = {
-        "f": "geojson",  
-        "geometry": polygon_str, 
+        "f": "json",
+        "geometry": polygon_str,
         "geometryType": "esriGeometryPolygon", # Interpret polygon_str as a bounding polygon
         "where": "IncidentSize >= 1 AND FireDiscoveryDateTime >= timestamp '2024-06-01 00:00:00' AND FireDiscoveryDateTime <= timestamp '2024-09-30 23:59:59'",
-        "outFields": "*" 
+        "outFields": "FireDiscoveryDateTime,IncidentSize",
+        "returnGeometry": "true",
+        "resultRecordCount": _PAGE_SIZE,
+        "resultOffset": 0
     }
-    
+
     try:
         print("Fetching public fire incident data from API...")
-        response = requests.get(url, params=params)
-        response.raise_for_status() # Catch HTTP errors
-        geojson_data = response.json()
-
-        # Noticed that if the query is wrong, response.status_code will be 200 but geojson_data will contain a 400 error
-        if "error" in geojson_data:
-            raise ValueError(f"API error: {geojson_data['error']['message']}")
-
-        print(f"Public data fetched successfully. Retrieved {len(geojson_data["features"])} records.")
-        return geojson_data
+        features = []
+        while True:
+            response = _SESSION.get(url, params=params, timeout=30)
+            response.raise_for_status() # Catch HTTP errors
+            # orjson's C parser is several times faster than response.json()
+            # on geometry-heavy bodies full of coordinate floats.
+            page = orjson.loads(response.content)
+
+            # Noticed that if the query is wrong, response.status_code will be 200 but the body will contain a 400 error
+            if "error" in page:
+                raise ValueError(f"API error: {page['error']['message']}")
+
+            features.extend(page["features"])
+
+            # Native JSON responses flag truncated pages at the top level.
+            if not page.get("exceededTransferLimit", False):
+                break
+            params["resultOffset"] += len(page["features"])
+
+        print(f"Public data fetched successfully. Retrieved {len(features)} records.")
+        return {"features": features}
     except requests.RequestException as e:
         print("Error fetching public data:", e)
         return None
@@ -53,135 +85,145 @@ def fetch_fire_data(polygon):
 # ---------------------------
 # Parse the Public Fire Incident Data
 # ---------------------------
-def parse_fire_data(geojson_data):
+def parse_fire_data(fire_data):
     """
-    Parses the public fire incident GeoJSON data.
-    For each feature, the following fields are extracted:
-      - Coordinates (from "geometry")
-      - Official discovery time ("FireDiscoveryDateTime" in Unix epoch milliseconds)
-      - Incident size ("IncidentSize")
+    Parses the public fire incident data (ArcGIS native JSON) into a DataFrame
+    with columns:
+      - "x", "y": fire coordinates (from "geometry")
+      - "detection_time": official discovery time ("FireDiscoveryDateTime" in
+        Unix epoch milliseconds, converted to UTC so it can be compared with
+        the WFS records)
+      - "incident_size": incident size in acres ("IncidentSize")
+    All conversions run as vectorized column operations instead of per-record
+    Python loops.
     """
-    fire_records = []
-    
-    if not geojson_data or "features" not in geojson_data:
+    empty = pd.DataFrame(columns=["x", "y", "detection_time", "incident_size"])
+
+    if not fire_data or "features" not in fire_data:
         print("No valid public fire data to parse.")
-        return fire_records
+        return empty
 
-    for feature in geojson_data["features"]:
-        try:
-            # Get coordinates 
-            coords = feature["geometry"]["coordinates"]
-            properties = feature["properties"]
-
-            # Convert the Unix timestamp (milliseconds) to a datetime object
-            # Include UTC timezone to compare with WFS records (can't compare offset naive to offset aware)
-            discovery_ts = properties.get("FireDiscoveryDateTime")
-            if discovery_ts is None:
-                continue
-            detection_time = datetime.fromtimestamp(discovery_ts / 1000, tz=timezone.utc)
-
-            # Get the incident size (in acres)
-            incident_size = properties.get("IncidentSize")
-            if incident_size is None:
-                continue
-
-            fire_records.append({
-                "coordinates": tuple(coords),
-                "detection_time": detection_time,
-                "incident_size": float(incident_size)
-            })
-        except Exception as e:
-            print("Error parsing a public record:", e)
-            continue
+    features = fire_data["features"]
+    if not features:
+        print("Parsed 0 public fire records.")
+        return empty
+
+    # One try/except around the bulk ingestion guards against truly malformed
+    # payloads; individual bad values are coerced to NaN/NaT below and dropped
+    # in one vectorized pass rather than per-record exception handling.
+    try:
+        xs = np.fromiter((feature["geometry"]["x"] for feature in features), dtype=np.float64, count=len(features))
+        ys = np.fromiter((feature["geometry"]["y"] for feature in features), dtype=np.float64, count=len(features))
+        attributes = pd.DataFrame([feature["attributes"] for feature in features])
+
+        fire_df = pd.DataFrame({
+            "x": xs,
+            "y": ys,
+            "detection_time": pd.to_datetime(attributes.get("FireDiscoveryDateTime"), unit="ms", utc=True, errors="coerce"),
+            "incident_size": pd.to_numeric(attributes.get("IncidentSize"), errors="coerce")
+        })
+    except Exception as e:
+        print("Error parsing public fire data:", e)
+        return empty
+
+    # Drop records missing a discovery time or size, and enforce the >= 1 acre
+    # floor from the query in case the server returns stray rows.
+    fire_df = fire_df.dropna(subset=["detection_time", "incident_size"])
+    fire_df = fire_df[fire_df["incident_size"] >= 1].reset_index(drop=True)
 
-    print(f"Parsed {len(fire_records)} public fire records.")
-    return fire_records
+    print(f"Parsed {len(fire_df)} public fire records.")
+    return fire_df
 
 # ---------------------------
 # Parse the OroraTech WFS Data
 # ---------------------------
 def parse_wfs_data(geojson_data):
     """
-    Parses the OroraTech WFS GeoJSON data.
-    For each feature, it extracts:
-      - The (multi)polygon geometry with a shapely shape
-      - Earliest detection time
+    Parses the OroraTech WFS GeoJSON data into a GeoDataFrame with columns:
+      - "polygon": the (multi)polygon geometry as a shapely shape
+      - "detection_time": earliest detection time (ISO 8601), converted to UTC
+    Detection times for all features are parsed with one vectorized
+    pd.to_datetime call instead of per-record fromisoformat/astimezone.
     """
-    wfs_records = []
-    
+    empty = pd.DataFrame(columns=["polygon", "detection_time"])
+
     if not geojson_data or "features" not in geojson_data:
         print("No valid WFS data to parse.")
-        return wfs_records
+        return empty
 
-    for feature in geojson_data["features"]:
-        try:
-            geometry = feature["geometry"]
-            properties = feature["properties"]
-
-            # Get the (multi)polygon with a shapely shape
-            # Handles both polygon and multipolgon cases
-            poly = shape(geometry)
-            
-            # Parse the detection time (ISO 8601 format).
-            # Convert to UTC for ease of "visual" comparison
-            detection_str = properties.get("oldest_detection")
-            if detection_str is None:
-                continue
-            detection_time = datetime.fromisoformat(detection_str).astimezone(timezone.utc)
-
-            wfs_records.append({
-                "polygon": poly,  # shapely shape
-                "detection_time": detection_time
-            })
-        except Exception as e:
-            print("Error parsing a WFS record:", e)
-            continue
+    features = geojson_data["features"]
+    if not features:
+        print("Parsed 0 WFS records.")
+        return empty
+
+    # One try/except around the bulk ingestion; unparseable detection times
+    # are coerced to NaT and dropped in a single pass below.
+    try:
+        # Build all (multi)polygon geometries in a single C call from the
+        # per-feature geometry JSON, instead of one shape() call per feature
+        # Handles both polygon and multipolgon cases
+        geoms_json = [orjson.dumps(feature["geometry"]) for feature in features]
+        polys = shapely.from_geojson(geoms_json)
+
+        detection_strs = [feature["properties"].get("oldest_detection") for feature in features]
+        detection_times = pd.to_datetime(detection_strs, utc=True, format="ISO8601", errors="coerce")
+
+        wfs_df = gpd.GeoDataFrame({
+            "polygon": polys,
+            "detection_time": detection_times
+        }, geometry="polygon", crs="EPSG:4326")
+    except Exception as e:
+        print("Error parsing WFS data:", e)
+        return empty
+
+    # Drop features without a parseable detection time, as before.
+    wfs_df = wfs_df.dropna(subset=["detection_time"]).reset_index(drop=True)
 
-    print(f"Parsed {len(wfs_records)} WFS records.")
-    return wfs_records
+    print(f"Parsed {len(wfs_df)} WFS records.")
+    return wfs_df
 
 # ---------------------------
 # Analyze the Public Fire Data
 # ---------------------------
-def analyze_data(fire_records):
+def analyze_data(fire_df):
     """
     Analyzes public fire records:
-      - Extracts the hour (0-23) from the official discovery time.
-      - BUilds a DataFrame to analyze the distribution of discovery hours and incident sizes.
+      - Adds an "hour" column (0-23, UTC) extracted from the official discovery time.
       - Finds the hour (UTC) that most fires occur at
-      - Finds the number of fires larger than 1000 acres 
+      - Finds the number of fires larger than 1000 acres
       - Computes the correlation between discovery hour and incident size.
     """
-    hours = [record["detection_time"].hour for record in fire_records]
-    sizes = [record["incident_size"] for record in fire_records]
-
-    df = pd.DataFrame({
-        "hour": hours,
-        "size": sizes
-    })
-
-    # Determine the hour (UTC) when most fires occur
-    if not df.empty:
-        most_common_hour = df["hour"].value_counts().idxmax()  
+    # Vectorized dt accessor; the column stays on the frame for later use.
+    fire_df["hour"] = fire_df["detection_time"].dt.hour
+
+    # All statistics below run on the raw arrays, without building any
+    # intermediate Series.
+    hours = fire_df["hour"].to_numpy()
+    sizes = fire_df["incident_size"].to_numpy()
+
+    # Determine the hour (UTC) when most fires occur. bincount over the fixed
+    # 0-23 range replaces value_counts' hash-and-sort pass.
+    if not fire_df.empty:
+        most_common_hour = int(np.bincount(hours, minlength=24).argmax())
         print(f"Most fires occur at UTC hour: {most_common_hour}")
     else:
         most_common_hour = None
         print("No data available to determine the most common hour.")
 
     # Determine number of fires larger then 1000 acres
-    large_fire_count = (df["size"] > 1000).sum()
+    large_fire_count = int(np.count_nonzero(sizes > 1000))
     print(f"Number of fires larger than 1000 acres: {large_fire_count}")
 
     # Determine correlation
-    if len(df) > 1:
-        correlation = df["hour"].corr(df["size"])
+    if len(fire_df) > 1:
+        correlation = float(np.corrcoef(hours, sizes)[0, 1])
         print(f"Correlation between discovery hour and incident size: {correlation:.3f}")
     else:
         correlation = None
         print("Not enough data to compute correlation.")
 
     return {
-        "dataframe": df,
+        "dataframe": fire_df,
         "most_common_hour": most_common_hour,
         "large_fire_count": large_fire_count,
         "correlation": correlation
@@ -196,28 +238,33 @@ def visualize_data(analysis_results):
       - Histogram of fire discovery hours.
       - Histogram of incident sizes.
       - Scatter plot of discovery hour vs. incident size with correlation annotation.
+    The figure is saved to fire_analysis.png rather than shown interactively.
     """
     df = analysis_results["dataframe"]
-    hours = df["hour"]
-    sizes = df["size"]
+    hours = df["hour"].to_numpy()
+    sizes = df["incident_size"].to_numpy()
 
     fig, axs = plt.subplots(1, 3, figsize=(18, 5))
 
-    # Histogram of discovery hours
-    axs[0].hist(hours, bins=range(0, 25), edgecolor="black", align="mid")
+    # Histogram of discovery hours: bin once with NumPy, then draw plain bars
+    # so matplotlib does not re-bin (and copy) the data internally.
+    hour_counts = np.bincount(hours, minlength=24)
+    axs[0].bar(np.arange(24), hour_counts, width=1.0, edgecolor="black")
     axs[0].set_title("Distribution of Fire Discovery Hours")
     axs[0].set_xlabel("Hour of Day")
     axs[0].set_ylabel("Number of Fires")
     axs[0].set_xticks(range(0, 25))
 
-    # Histogram of incident sizes
-    axs[1].hist(sizes, bins=20, edgecolor="black")
+    # Histogram of incident sizes, binned the same way
+    size_counts, size_edges = np.histogram(sizes, bins=20)
+    axs[1].bar(size_edges[:-1], size_counts, width=np.diff(size_edges), align="edge", edgecolor="black")
     axs[1].set_title("Distribution of Incident Sizes")
     axs[1].set_xlabel("Incident Size (acres)")
     axs[1].set_ylabel("Number of Fires")
 
-    # Scatter plot: Discovery Hour vs. Incident Size
-    axs[2].scatter(hours, sizes, alpha=0.7)
+    # Scatter plot: Discovery Hour vs. Incident Size. Rasterized so many
+    # thousands of points become one image instead of per-point path objects.
+    axs[2].scatter(hours, sizes, alpha=0.5, s=4, rasterized=True)
     axs[2].set_title("Discovery Hour vs. Incident Size")
     axs[2].set_xlabel("Discovery Hour")
     axs[2].set_ylabel("Incident Size (acres)")
@@ -227,37 +274,53 @@ def visualize_data(analysis_results):
                     verticalalignment="top", bbox=dict(boxstyle="round", facecolor="bisque", alpha=0.5))
 
     plt.tight_layout()
-    plt.show()
+    output_path = "fire_analysis.png"
+    fig.savefig(output_path, dpi=120)
+    plt.close(fig)
+    print(f"Saved visualizations to {output_path}")
 
 # ---------------------------
 # Compare Detection Times
 # ---------------------------
-def compare_detection_times(public_records, wfs_records):
+def compare_detection_times(public_df, wfs_df):
     """
     For each public fire record (point), checks if it lies within any WFS (multi)polygon.
     If so, compares the official discovery time with the WFS detection time.
     If the WFS detection time is earlier, the fire is considered first detected by WFS.
+    Returns a DataFrame with one row per fire first detected by WFS.
     """
-    # Create a dictionary for quick lookup of WFS records by unique_id
-    early_detected = []
-
-    for record in public_records:
-        # Convert the public fire's coordinates to a shapely Point.
-        fire_point = Point(record["coordinates"])
-        official_time = record["detection_time"]
-        
-        # Check if the point is contained in any WFS (multi)polygon.
-        for wfs in wfs_records:
-            poly = wfs["polygon"]
-            wfs_detection_time = wfs["detection_time"]
-            if poly.contains(fire_point) and wfs_detection_time < official_time:
-                early_detected.append({
-                    "coordinates": record["coordinates"],
-                    "wfs_detection_time": wfs_detection_time,
-                    "official_time": official_time,
-                    "incident_size": record["incident_size"]
-                })
-                break  # Found a polygon that contains the point.
+    # Temporal pre-filter: a WFS polygon detected after the latest official
+    # discovery can never beat any fire, so it never has to enter the join.
+    latest_official = public_df["detection_time"].max()
+    wfs_df = wfs_df[wfs_df["detection_time"] < latest_official]
+    if wfs_df.empty:
+        print("Found 0 fires first detected by WFS.")
+        return pd.DataFrame(columns=["x", "y", "wfs_detection_time", "official_time", "incident_size"])
+
+    # Build all fire points in one C call and let GeoPandas' R-tree backed
+    # sjoin do the prune-and-refine containment pass for every (fire, polygon)
+    # pair at once.
+    public_gdf = gpd.GeoDataFrame(
+        public_df,
+        geometry=gpd.points_from_xy(public_df["x"], public_df["y"]),
+        crs="EPSG:4326"
+    )
+    joined = gpd.sjoin(public_gdf, wfs_df, predicate="within", how="inner",
+                       lsuffix="fire", rsuffix="wfs")
+
+    # Vectorized time filter, then keep the earliest qualifying WFS detection
+    # per fire (the join index is the fire row).
+    early = joined[joined["detection_time_wfs"] < joined["detection_time_fire"]]
+    early = early.sort_values("detection_time_wfs")
+    early = early[~early.index.duplicated(keep="first")].sort_index()
+
+    early_detected = pd.DataFrame({
+        "x": early["x"].to_numpy(),
+        "y": early["y"].to_numpy(),
+        "wfs_detection_time": early["detection_time_wfs"].to_numpy(),
+        "official_time": early["detection_time_fire"].to_numpy(),
+        "incident_size": early["incident_size"].to_numpy()
+    })
 
     print(f"Found {len(early_detected)} fires first detected by WFS.")
     return early_detected
@@ -276,8 +339,8 @@ def main():
 
     # Read bouding polygon from file
     try:
-        with open(args.bpoly_file, 'r') as f:
-            polygon = json.load(f)
+        with open(args.bpoly_file, 'rb') as f:
+            polygon = orjson.loads(f.read())
     except Exception as e:
         print("Error reading the polygon file:", e)
         exit(1)
@@ -287,41 +350,55 @@ def main():
         exit(2)
 
     # Fetch public fire incident data from the API
-    public_geojson = fetch_fire_data(polygon)
-    
-    if public_geojson is None:
+    public_data = fetch_fire_data(polygon)
+
+    if public_data is None:
         print("Failed to retrieve public fire data.")
         exit(0)
 
     # Parse the fetched public data
-    public_records = parse_fire_data(public_geojson)
-    
+    public_df = parse_fire_data(public_data)
+
     # Analyze and visualize the public data
-    if public_records:
-        analysis_results = analyze_data(public_records)
+    if not public_df.empty:
+        analysis_results = analyze_data(public_df)
         visualize_data(analysis_results)
     else:
         print("No valid public fire records found.")
 
-    # Compare with OroraTech WFS data
-    try:
-        with open(args.wfs, 'r') as f:
-            wfs_geojson = json.load(f)
-    except Exception as e:
-        print("Error loading WFS data file:", e)
-        wfs_geojson = None
-
-    print(len(wfs_geojson["features"]))
+    # Compare with OroraTech WFS data. Parsed results are cached next to the
+    # GeoJSON as Parquet (WKB geometries over Arrow), which loads far faster
+    # than re-parsing JSON and rebuilding every geometry on reruns.
+    wfs_path = Path(args.wfs)
+    wfs_cache = wfs_path.with_suffix(".parquet")
+    wfs_df = None
 
-    if wfs_geojson:
-        wfs_records = parse_wfs_data(wfs_geojson)
-        if public_records and wfs_records:
-            early_detected = compare_detection_times(public_records, wfs_records)
-            if early_detected:
+    if wfs_cache.exists() and wfs_path.exists() and wfs_cache.stat().st_mtime > wfs_path.stat().st_mtime:
+        wfs_df = gpd.read_parquet(wfs_cache)
+        print(f"Loaded {len(wfs_df)} cached WFS records from {wfs_cache}.")
+    else:
+        try:
+            with open(wfs_path, 'rb') as f:
+                wfs_geojson = orjson.loads(f.read())
+        except Exception as e:
+            print("Error loading WFS data file:", e)
+            wfs_geojson = None
+
+        if wfs_geojson:
+            print(len(wfs_geojson["features"]))
+            wfs_df = parse_wfs_data(wfs_geojson)
+            if not wfs_df.empty:
+                wfs_df.to_parquet(wfs_cache)
+
+    if wfs_df is not None:
+        if not public_df.empty and not wfs_df.empty:
+            early_detected = compare_detection_times(public_df, wfs_df)
+            if not early_detected.empty:
                 print("\nFires first detected by WFS (detection time is earlier than official discovery time):")
-                for fire in early_detected:
-                    print(f"- Fire at {fire['coordinates']} with official discovery at {fire['official_time']} was detected by WFS at {fire['wfs_detection_time']}")
-                    print(f"  Incident size was {fire["incident_size"]} acres.")
+                cols = ["x", "y", "wfs_detection_time", "official_time", "incident_size"]
+                for x, y, wfs_time, official_time, incident_size in early_detected[cols].itertuples(index=False, name=None):
+                    print(f"- Fire at ({x}, {y}) with official discovery at {official_time} was detected by WFS at {wfs_time}")
+                    print(f"  Incident size was {incident_size} acres.")
             else:
                 print("No fires were detected earlier by the WFS system.")
         else: